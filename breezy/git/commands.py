@@ -69,10 +69,10 @@ class cmd_git_import(Command):
         except NotBranchError:
             head_controldir = dest_format.initialize_on_transport_ex(
                 head_transport, create_prefix=True)[1]
-        try:
-            return head_controldir.open_branch()
-        except NotBranchError:
+            # A freshly initialized control directory has no branch yet, so
+            # don't bother probing for one.
             return head_controldir.create_branch()
+        return self._get_colocated_branch(head_controldir, None)
 
     def run(self, src_location, dest_location=None, colocated=False, dest_format=None):
         import os
@@ -134,16 +134,23 @@ class cmd_git_import(Command):
         interrepo = InterRepository.get(source_repo, target_repo)
         mapping = source_repo.get_mapping()
         result = interrepo.fetch()
+        # Filter out refs that aren't branches (tags, notes, ...) up front,
+        # so the progress bar reflects the branches that actually get created.
+        branch_refs = []
+        for name, sha in result.refs.items():
+            try:
+                branch_name = ref_to_branch_name(name)
+            except ValueError:
+                # Not a branch, ignore
+                continue
+            branch_refs.append((name, branch_name, sha))
+        use_colocated = colocated and getattr(
+            target_controldir._format, "colocated_branches", False)
+        revision_id_foreign_to_bzr = mapping.revision_id_foreign_to_bzr
         with ui.ui_factory.nested_progress_bar() as pb:
-            for i, (name, sha) in enumerate(result.refs.items()):
-                try:
-                    branch_name = ref_to_branch_name(name)
-                except ValueError:
-                    # Not a branch, ignore
-                    continue
-                pb.update(gettext("creating branches"), i, len(result.refs))
-                if (getattr(target_controldir._format, "colocated_branches",
-                            False) and colocated):
+            for i, (name, branch_name, sha) in enumerate(branch_refs):
+                pb.update(gettext("creating branches"), i, len(branch_refs))
+                if use_colocated:
                     if name == "HEAD":
                         branch_name = None
                     head_branch = self._get_colocated_branch(
@@ -151,7 +158,7 @@ class cmd_git_import(Command):
                 else:
                     head_branch = self._get_nested_branch(
                         dest_transport, dest_format, branch_name)
-                revid = mapping.revision_id_foreign_to_bzr(sha)
+                revid = revision_id_foreign_to_bzr(sha)
                 source_branch = LocalGitBranch(
                     source_repo.controldir, source_repo, sha)
                 if head_branch.last_revision() != revid:
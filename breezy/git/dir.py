@@ -19,6 +19,7 @@
 
 import contextlib
 import os
+import time
 
 try:
     from dulwich.refs import SymrefLoop
@@ -28,6 +29,7 @@ except ImportError:
 from .. import (
     branch as _mod_branch,
     errors as brz_errors,
+    lru_cache,
     trace,
     osutils,
     urlutils,
@@ -60,6 +62,29 @@ from .transportgit import (
     )
 
 
+# Creation modes found by LocalGitDir._find_creation_modes, keyed by transport
+# base. Entries expire after _MODE_CACHE_TIMEOUT seconds so that changes to
+# the directory permissions are eventually picked up; the cache is bounded so
+# that long-running processes opening many repositories do not grow it
+# without limit.
+_mode_cache = lru_cache.LRUCache(1000)
+_MODE_CACHE_TIMEOUT = 60
+
+
+# URL-quoted ref and branch names, as used by get_branch_reference. Only a
+# handful of names (e.g. "master") are common, so keep a small cache.
+_quoted_ref_cache = lru_cache.LRUCache(256)
+
+
+def _quote_ref_component(name):
+    """Quote a ref or branch name for use in a segment parameter."""
+    quoted = _quoted_ref_cache.get(name)
+    if quoted is None:
+        quoted = urlutils.quote(name, '')
+        _quoted_ref_cache[name] = quoted
+    return quoted
+
+
 class GitDirConfig(object):
 
     def get_default_stack_on(self):
@@ -128,6 +153,32 @@ class GitDir(ControlDir):
     def checkout_metadir(self, stacked=False):
         return format_registry.make_controldir("git")
 
+    # Ref selected by the segment parameters of the URL, see _get_default_ref.
+    _default_ref = None
+
+    def _get_default_ref(self):
+        """Return the ref selected by the user through the URL.
+
+        The segment parameters of the URL don't change during the lifetime
+        of a control directory, so this is only worked out once.
+        """
+        if self._default_ref is not None:
+            return self._default_ref
+        segment_parameters = getattr(
+            self.user_transport, "get_segment_parameters", lambda: {})()
+        ref = segment_parameters.get("ref")
+        if ref is not None:
+            ref = urlutils.unquote_to_bytes(ref)
+        elif getattr(self, "_get_selected_branch", False):
+            branch = self._get_selected_branch()
+            if branch is not None:
+                from .refs import branch_name_to_ref
+                ref = branch_name_to_ref(branch)
+        if ref is None:
+            ref = b"HEAD"
+        self._default_ref = ref
+        return ref
+
     def _get_selected_ref(self, branch, ref=None):
         if ref is not None and branch is not None:
             raise brz_errors.BzrError("can't specify both ref and branch")
@@ -136,17 +187,7 @@ class GitDir(ControlDir):
         if branch is not None:
             from .refs import branch_name_to_ref
             return branch_name_to_ref(branch)
-        segment_parameters = getattr(
-            self.user_transport, "get_segment_parameters", lambda: {})()
-        ref = segment_parameters.get("ref")
-        if ref is not None:
-            return urlutils.unquote_to_bytes(ref)
-        if branch is None and getattr(self, "_get_selected_branch", False):
-            branch = self._get_selected_branch()
-            if branch is not None:
-                from .refs import branch_name_to_ref
-                return branch_name_to_ref(branch)
-        return b"HEAD"
+        return self._get_default_ref()
 
     def get_config(self):
         return GitDirConfig()
@@ -247,7 +288,8 @@ class GitDir(ControlDir):
         from ..repository import InterRepository
         from .mapping import default_mapping
         from ..transport.local import LocalTransport
-        from .refs import is_peeled
+        from dulwich.objects import Tag
+        from .refs import ANNOTATED_TAG_SUFFIX, is_peeled
         if no_tree:
             format = BareLocalGitControlDirFormat()
         else:
@@ -270,11 +312,30 @@ class GitDir(ControlDir):
             determine_wants = interrepo.determine_wants_all
         (pack_hint, _, refs) = interrepo.fetch_objects(determine_wants,
                                                        mapping=default_mapping)
+        new_refs = {}
+        peeled = {}
         for name, val in refs.items():
             if is_peeled(name):
+                peeled[name[:-len(ANNOTATED_TAG_SUFFIX)]] = val
+                continue
+            if val not in target_git_repo.object_store:
                 continue
-            if val in target_git_repo.object_store:
+            if name == b'HEAD':
+                # HEAD is usually a symref, which needs to be followed.
                 target_git_repo.refs[name] = val
+            else:
+                new_refs[name] = val
+        # The packed-refs file claims to be fully peeled, so record what
+        # each annotated tag peels to; local fetches do not report it.
+        object_store = target_git_repo.object_store
+        for name, val in new_refs.items():
+            if name in peeled:
+                continue
+            type_num, unused_data = object_store.get_raw(val)
+            if type_num == Tag.type_num:
+                peeled[name] = object_store.peel_sha(val).id
+        # Write all other refs in one go, rather than a file per ref.
+        target_git_repo.refs.add_packed_refs(new_refs, peeled)
         result_dir = LocalGitDir(transport, target_git_repo, format)
         result_branch = result_dir.open_branch()
         try:
@@ -499,9 +560,10 @@ class LocalGitControlDirFormat(GitControlDirFormat):
         return external_url.startswith("file:")
 
     def is_control_filename(self, filename):
-        return (filename == '.git'
-                or filename.startswith('.git/')
-                or filename.startswith('.git\\'))
+        # This is called for every path in tree walks, so avoid the method
+        # calls of several startswith() checks.
+        return (filename[:4] == '.git'
+                and (len(filename) == 4 or filename[4] in '/\\'))
 
 
 class BareLocalGitControlDirFormat(LocalGitControlDirFormat):
@@ -547,15 +609,55 @@ class LocalGitDir(GitDir):
         else:
             self.transport = transport.clone('.git')
         self._mode_check_done = None
+        self._symref_cache = {}
+
+    def _invalidate_ref_cache(self):
+        """Forget any cached symbolic reference lookups."""
+        self._symref_cache.clear()
+
+    def _ref_signature(self, ref):
+        """Return a cheap stat-based signature for a loose ref.
+
+        :return: A tuple identifying the current contents of the loose ref
+            file, None if there is no such file or False if the signature
+            can not be determined.
+        """
+        refs = self._git.refs
+        if ref == b'HEAD':
+            transport = getattr(refs, 'worktree_transport', None)
+        else:
+            transport = getattr(refs, 'transport', None)
+        if transport is None:
+            return False
+        try:
+            st = transport.stat(urlutils.quote_from_bytes(ref))
+        except NoSuchFile:
+            return None
+        except brz_errors.TransportNotPossible:
+            return False
+        return (getattr(st, 'st_ino', None), st.st_mtime, st.st_size)
 
     def _get_symref(self, ref):
+        try:
+            (signatures, target) = self._symref_cache[ref]
+        except KeyError:
+            pass
+        else:
+            if all(self._ref_signature(r) == sig for (r, sig) in signatures):
+                return target
         ref_chain, unused_sha = self._git.refs.follow(ref)
         if len(ref_chain) == 1:
-            return None
-        return ref_chain[1]
+            target = None
+        else:
+            target = ref_chain[1]
+        signatures = [(r, self._ref_signature(r)) for r in ref_chain]
+        if all(sig is not False for (r, sig) in signatures):
+            self._symref_cache[ref] = (signatures, target)
+        return target
 
     def set_branch_reference(self, target_branch, name=None):
         ref = self._get_selected_ref(name)
+        self._invalidate_ref_cache()
         target_transport = target_branch.controldir.control_transport
         if self.control_transport.base == target_transport.base:
             if ref == target_branch.ref:
@@ -601,11 +703,11 @@ class LocalGitDir(GitDir):
             try:
                 branch_name = ref_to_branch_name(target_ref)
             except ValueError:
-                params = {'ref': urlutils.quote(
-                    target_ref.decode('utf-8'), '')}
+                params = {'ref': _quote_ref_component(
+                    target_ref.decode('utf-8'))}
             else:
                 if branch_name != '':
-                    params = {'branch': urlutils.quote(branch_name, '')}
+                    params = {'branch': _quote_ref_component(branch_name)}
                 else:
                     params = {}
             try:
@@ -645,31 +747,62 @@ class LocalGitDir(GitDir):
             return self.transport
         raise brz_errors.IncompatibleFormat(format, self._format)
 
-    def open_branch(self, name=None, unsupported=False, ignore_fallbacks=None,
-                    ref=None, possible_transports=None, nascent_ok=False):
-        """'create' a branch for this dir."""
-        repo = self.find_repository()
+    def _open_branch_for_ref(self, repo, ref, commondir=None):
+        """Open the branch a ref refers to, following symbolic refs.
+
+        :param repo: Repository to use for the branch
+        :param ref: Ref to open the branch for
+        :param commondir: Control directory the repository lives in, if
+            already known
+        """
         from .branch import LocalGitBranch
-        ref = self._get_selected_ref(name, ref)
-        if not nascent_ok and ref not in self._git.refs:
-            raise brz_errors.NotBranchError(
-                self.root_transport.base, controldir=self)
         try:
             ref_chain, unused_sha = self._git.refs.follow(ref)
         except SymrefLoop as e:
             raise BranchReferenceLoop(self)
         if ref_chain[-1] == b'HEAD':
             controldir = self
+        elif commondir is not None:
+            controldir = commondir
         else:
             controldir = self._find_commondir()
         return LocalGitBranch(controldir, repo, ref_chain[-1])
 
+    def open_branch(self, name=None, unsupported=False, ignore_fallbacks=None,
+                    ref=None, possible_transports=None, nascent_ok=False):
+        """'create' a branch for this dir."""
+        repo = self.find_repository()
+        ref = self._get_selected_ref(name, ref)
+        if not nascent_ok and ref not in self._git.refs:
+            raise brz_errors.NotBranchError(
+                self.root_transport.base, controldir=self)
+        return self._open_branch_for_ref(repo, ref)
+
+    def get_branches(self):
+        from .refs import ref_to_branch_name
+        # All branches share the same repository, so only look it up once;
+        # the refs come straight from the container so are known to exist.
+        commondir = self._find_commondir()
+        repo = self._gitrepository_class(commondir)
+        ret = {}
+        for ref in self._git.refs.keys():
+            try:
+                branch_name = ref_to_branch_name(ref)
+            except UnicodeDecodeError:
+                trace.warning("Ignoring branch %r with unicode error ref", ref)
+                continue
+            except ValueError:
+                continue
+            ret[branch_name] = self._open_branch_for_ref(repo, ref, commondir)
+        return ret
+
     def destroy_branch(self, name=None):
         refname = self._get_selected_ref(name)
         if refname == b'HEAD':
             # HEAD can't be removed
             raise brz_errors.UnsupportedOperation(
                 self.destroy_branch, self)
+        self._invalidate_ref_cache()
         try:
             del self._git.refs[refname]
         except KeyError:
@@ -700,9 +833,12 @@ class LocalGitDir(GitDir):
 
     def open_workingtree(self, recommend_upgrade=True, unsupported=False):
         if not self._git.bare:
-            repo = self.find_repository()
             from .workingtree import GitWorkingTree
-            branch = self.open_branch(ref=b'HEAD', nascent_ok=True)
+            # Share the repository with the branch rather than going through
+            # open_branch(), which would look it up again.
+            commondir = self._find_commondir()
+            repo = self._gitrepository_class(commondir)
+            branch = self._open_branch_for_ref(repo, b'HEAD', commondir)
             return GitWorkingTree(self, repo, branch)
         loc = urlutils.unescape_for_display(self.root_transport.base, 'ascii')
         raise brz_errors.NoWorkingTree(loc)
@@ -719,6 +855,7 @@ class LocalGitDir(GitDir):
         refname = self._get_selected_ref(name, ref)
         if refname != b'HEAD' and refname in self._git.refs:
             raise brz_errors.AlreadyBranchError(self.user_url)
+        self._invalidate_ref_cache()
         repo = self.open_repository()
         if refname in self._git.refs:
             ref_chain, unused_sha = self._git.refs.follow(
@@ -771,6 +908,16 @@ class LocalGitDir(GitDir):
         if self._mode_check_done:
             return
         self._mode_check_done = True
+        base = self.transport.base
+        try:
+            (timestamp, dir_mode, file_mode) = _mode_cache[base]
+        except KeyError:
+            pass
+        else:
+            if time.time() - timestamp < _MODE_CACHE_TIMEOUT:
+                self._dir_mode = dir_mode
+                self._file_mode = file_mode
+                return
         try:
             st = self.transport.stat('.')
         except brz_errors.TransportNotPossible:
@@ -789,6 +936,7 @@ class LocalGitDir(GitDir):
                 self._dir_mode = (st.st_mode & 0o7777) | 0o0700
                 # Remove the sticky and execute bits for files
                 self._file_mode = self._dir_mode & ~0o7111
+        _mode_cache[base] = (time.time(), self._dir_mode, self._file_mode)
 
     def _get_file_mode(self):
         """Return Unix mode for newly created files, or None.
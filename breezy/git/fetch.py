@@ -21,18 +21,19 @@ from dulwich.objects import (
     Tag,
     Tree,
     S_IFGITLINK,
-    S_ISGITLINK,
     ZERO_SHA,
     )
 from dulwich.object_store import (
     tree_lookup_path,
     )
+import collections
 import posixpath
 import stat
 
 from .. import (
     debug,
     errors,
+    lru_cache,
     osutils,
     trace,
     )
@@ -74,6 +75,50 @@ from .object_store import (
     )
 
 
+# File modes that can be represented in a Bazaar inventory without storing
+# them separately.
+_NORMAL_MODES = frozenset([
+    stat.S_IFDIR, DEFAULT_FILE_MODE, stat.S_IFLNK, DEFAULT_FILE_MODE | 0o111,
+    S_IFGITLINK])
+
+# Mask for the file type bits of a git file mode.
+_S_IFMT = 0o170000
+
+
+# Text sizes and SHA1s (or symlink targets) of recently imported blobs, by
+# kind and git SHA. The same blob is often seen again in later revisions.
+_blob_info_cache = lru_cache.LRUCache(2048)
+
+
+class BatchedTexts(object):
+    """Collect records to be inserted into a VersionedFiles object.
+
+    Inserting every new text with its own insert_record_stream call is
+    expensive; groupcompress for example starts a new compression group for
+    each call. Records are buffered until flush() is called or their total
+    size exceeds max_size.
+    """
+
+    def __init__(self, texts, max_size=4 * 1024 * 1024):
+        self.texts = texts
+        self.max_size = max_size
+        self._records = []
+        self._size = 0
+
+    def insert_record_stream(self, stream):
+        for record in stream:
+            self._records.append(record)
+            self._size += record.size
+        if self._size > self.max_size:
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            self.texts.insert_record_stream(self._records)
+            self._records = []
+            self._size = 0
+
+
 def import_git_blob(texts, mapping, path, name, hexshas,
                     base_bzr_tree, parent_id, revision_id,
                     parent_bzr_trees, lookup_object, modes, store_updater,
@@ -103,25 +148,34 @@ def import_git_blob(texts, mapping, path, name, hexshas,
     ie = cls(file_id, decode_git_path(name), parent_id)
     if ie.kind == "file":
         ie.executable = mode_is_executable(mode)
+    blob = None
     if base_hexsha == hexsha and mode_kind(base_mode) == mode_kind(mode):
-        base_exec = base_bzr_tree.is_executable(decoded_path)
+        # Look the entry up once rather than walking the path for every
+        # attribute.
+        base_ie = base_bzr_tree.root_inventory.get_entry_by_path(
+            decoded_path)
         if ie.kind == "symlink":
-            ie.symlink_target = base_bzr_tree.get_symlink_target(decoded_path)
+            ie.symlink_target = base_ie.symlink_target
         else:
-            ie.text_size = base_bzr_tree.get_file_size(decoded_path)
-            ie.text_sha1 = base_bzr_tree.get_file_sha1(decoded_path)
-        if ie.kind == "symlink" or ie.executable == base_exec:
-            ie.revision = base_bzr_tree.get_file_revision(decoded_path)
-        else:
-            blob = lookup_object(hexsha)
+            ie.text_size = base_ie.text_size
+            ie.text_sha1 = base_ie.text_sha1
+        if ie.kind == "symlink" or ie.executable == base_ie.executable:
+            ie.revision = base_ie.revision
     else:
-        blob = lookup_object(hexsha)
+        info = _blob_info_cache.get((ie.kind, hexsha))
+        if info is None:
+            blob = lookup_object(hexsha)
+            if ie.kind == "symlink":
+                info = decode_git_path(blob.data)
+            else:
+                info = (sum(map(len, blob.chunked)),
+                        osutils.sha_strings(blob.chunked))
+            _blob_info_cache[(ie.kind, hexsha)] = info
         if ie.kind == "symlink":
             ie.revision = None
-            ie.symlink_target = decode_git_path(blob.data)
+            ie.symlink_target = info
         else:
-            ie.text_size = sum(map(len, blob.chunked))
-            ie.text_sha1 = osutils.sha_strings(blob.chunked)
+            (ie.text_size, ie.text_sha1) = info
     # Check what revision we should store
     parent_keys = []
     for ptree in parent_bzr_trees:
@@ -132,15 +186,16 @@ def import_git_blob(texts, mapping, path, name, hexshas,
             continue
         if ppath is None:
             continue
-        pkind = ptree.kind(ppath)
+        pie = ptree.root_inventory.get_entry_by_path(ppath)
+        pkind = pie.kind
         if (pkind == ie.kind and
-            ((pkind == "symlink" and ptree.get_symlink_target(ppath) == ie.symlink_target) or
-             (pkind == "file" and ptree.get_file_sha1(ppath) == ie.text_sha1 and
-                ptree.is_executable(ppath) == ie.executable))):
+            ((pkind == "symlink" and pie.symlink_target == ie.symlink_target) or
+             (pkind == "file" and pie.text_sha1 == ie.text_sha1 and
+                pie.executable == ie.executable))):
             # found a revision in one of the parents to use
-            ie.revision = ptree.get_file_revision(ppath)
+            ie.revision = pie.revision
             break
-        parent_key = (file_id, ptree.get_file_revision(ppath))
+        parent_key = (file_id, pie.revision)
         if parent_key not in parent_keys:
             parent_keys.append(parent_key)
     if ie.revision is None:
@@ -151,6 +206,8 @@ def import_git_blob(texts, mapping, path, name, hexshas,
         if ie.kind == 'symlink':
             chunks = []
         else:
+            if blob is None:
+                blob = lookup_object(hexsha)
             chunks = blob.chunked
         texts.insert_record_stream([
             ChunkedContentFactory((file_id, ie.revision),
@@ -166,7 +223,8 @@ def import_git_blob(texts, mapping, path, name, hexshas,
         old_path = None
     invdelta.append((old_path, decoded_path, file_id, ie))
     if base_hexsha != hexsha:
-        store_updater.add_object(blob, (ie.file_id, ie.revision), path)
+        store_updater.add_object(
+            ("blob", hexsha), (ie.file_id, ie.revision), path)
     return invdelta
 
 
@@ -220,18 +278,20 @@ def remove_disappeared_children(base_bzr_tree, path, base_tree,
     if not isinstance(path, str):
         raise TypeError(path)
     ret = []
-    for name, mode, hexsha in base_tree.iteritems():
-        if name in existing_children:
-            continue
-        c_path = posixpath.join(path, decode_git_path(name))
-        file_id = base_bzr_tree.path2id(c_path)
-        if file_id is None:
-            raise TypeError(file_id)
-        ret.append((c_path, None, file_id, None))
-        if stat.S_ISDIR(mode):
-            ret.extend(remove_disappeared_children(
-                base_bzr_tree, c_path, lookup_object(hexsha), [],
-                lookup_object))
+    todo = [(path, base_tree, existing_children)]
+    while todo:
+        (path, base_tree, existing_children) = todo.pop()
+        for name, mode, hexsha in base_tree.iteritems():
+            if name in existing_children:
+                continue
+            c_path = posixpath.join(path, decode_git_path(name))
+            file_id = base_bzr_tree.path2id(c_path)
+            if file_id is None:
+                raise TypeError(file_id)
+            ret.append((c_path, None, file_id, None))
+            if stat.S_ISDIR(mode):
+                # Everything below a removed directory is removed too
+                todo.append((c_path, lookup_object(hexsha), ()))
     return ret
 
 
@@ -249,85 +309,110 @@ def import_git_tree(texts, mapping, path, name, hexshas,
         delta
     :return: Inventory delta for this subtree
     """
-    (base_hexsha, hexsha) = hexshas
-    (base_mode, mode) = modes
     if not isinstance(path, bytes):
         raise TypeError(path)
     if not isinstance(name, bytes):
         raise TypeError(name)
-    if base_hexsha == hexsha and base_mode == mode:
-        # If nothing has changed since the base revision, we're done
-        return [], {}
     invdelta = []
-    file_id = lookup_file_id(osutils.safe_unicode(path))
-    ie = InventoryDirectory(file_id, decode_git_path(name), parent_id)
-    tree = lookup_object(hexsha)
-    if base_hexsha is None:
-        base_tree = None
-        old_path = None  # Newly appeared here
-    else:
-        base_tree = lookup_object(base_hexsha)
-        old_path = decode_git_path(path)  # Renames aren't supported yet
-    new_path = decode_git_path(path)
-    if base_tree is None or type(base_tree) is not Tree:
-        ie.revision = revision_id
-        invdelta.append((old_path, new_path, ie.file_id, ie))
-        texts.insert_record_stream([
-            ChunkedContentFactory((ie.file_id, ie.revision), (), None, [])])
-    # Remember for next time
-    existing_children = set()
     child_modes = {}
-    for name, child_mode, child_hexsha in tree.iteritems():
-        existing_children.add(name)
-        child_path = posixpath.join(path, name)
-        if type(base_tree) is Tree:
-            try:
-                child_base_mode, child_base_hexsha = base_tree[name]
-            except KeyError:
-                child_base_hexsha = None
-                child_base_mode = 0
-        else:
-            child_base_hexsha = None
-            child_base_mode = 0
-        if stat.S_ISDIR(child_mode):
-            subinvdelta, grandchildmodes = import_git_tree(
-                texts, mapping, child_path, name,
-                (child_base_hexsha, child_hexsha), base_bzr_tree, file_id,
-                revision_id, parent_bzr_trees, lookup_object,
-                (child_base_mode, child_mode), store_updater, lookup_file_id,
-                allow_submodules=allow_submodules)
-        elif S_ISGITLINK(child_mode):  # submodule
+    # Rather than recursing, keep a stack of entries still to be imported.
+    # Children are pushed in reverse order and a directory is finished off
+    # (disappeared children removed, tree object recorded) only after all
+    # of its children have been handled, so the entries are visited in the
+    # same depth-first order as a recursive walk would.
+    todo = [(stat.S_IFDIR, path, name, hexshas, modes, parent_id)]
+    while todo:
+        entry = todo.pop()
+        if entry[0] is None:
+            # All children of this directory have been imported
+            (unused_fmt, path, file_id, tree, base_tree, old_path,
+             existing_children) = entry
+            if existing_children is not None:
+                # Remove any children that have disappeared
+                invdelta.extend(remove_disappeared_children(
+                    base_bzr_tree, old_path, base_tree, existing_children,
+                    lookup_object))
+            store_updater.add_object(tree, (file_id, revision_id), path)
+            continue
+        (fmt, path, name, hexshas, modes, parent_id) = entry
+        if fmt == S_IFGITLINK:
             if not allow_submodules:
                 raise SubmodulesRequireSubtrees()
-            subinvdelta, grandchildmodes = import_git_submodule(
-                texts, mapping, child_path, name,
-                (child_base_hexsha, child_hexsha),
-                base_bzr_tree, file_id, revision_id, parent_bzr_trees,
-                lookup_object, (child_base_mode, child_mode), store_updater,
-                lookup_file_id)
-        else:
+            subinvdelta, unused_modes = import_git_submodule(
+                texts, mapping, path, name, hexshas, base_bzr_tree,
+                parent_id, revision_id, parent_bzr_trees, lookup_object,
+                modes, store_updater, lookup_file_id)
+            invdelta.extend(subinvdelta)
+            continue
+        if fmt != stat.S_IFDIR:
             if not mapping.is_special_file(name):
-                subinvdelta = import_git_blob(
-                    texts, mapping, child_path, name,
-                    (child_base_hexsha, child_hexsha), base_bzr_tree, file_id,
-                    revision_id, parent_bzr_trees, lookup_object,
-                    (child_base_mode, child_mode), store_updater,
-                    lookup_file_id)
+                invdelta.extend(import_git_blob(
+                    texts, mapping, path, name, hexshas, base_bzr_tree,
+                    parent_id, revision_id, parent_bzr_trees, lookup_object,
+                    modes, store_updater, lookup_file_id))
+            continue
+        (base_hexsha, hexsha) = hexshas
+        (base_mode, mode) = modes
+        if base_hexsha == hexsha and base_mode == mode:
+            # If nothing has changed since the base revision, we're done
+            continue
+        new_path = decode_git_path(path)
+        file_id = lookup_file_id(new_path)
+        ie = InventoryDirectory(file_id, decode_git_path(name), parent_id)
+        tree = lookup_object(hexsha)
+        if base_hexsha is None:
+            base_tree = None
+            old_path = None  # Newly appeared here
+        else:
+            base_tree = lookup_object(base_hexsha)
+            old_path = new_path  # Renames aren't supported yet
+        if base_tree is None or type(base_tree) is not Tree:
+            ie.revision = revision_id
+            invdelta.append((old_path, new_path, ie.file_id, ie))
+            texts.insert_record_stream([
+                ChunkedContentFactory((ie.file_id, ie.revision), (), None, [])])
+        # Remember for next time
+        existing_children = set()
+        kept_children = 0
+        children = []
+        base_is_tree = (type(base_tree) is Tree)
+        # Git tree entry names never contain a slash, so child paths can
+        # simply be appended to the directory path.
+        if path:
+            path_prefix = path + b"/"
+        else:
+            path_prefix = b""
+        for name, child_mode, child_hexsha in tree.iteritems():
+            existing_children.add(name)
+            child_path = path_prefix + name
+            if child_mode not in _NORMAL_MODES:
+                child_modes[child_path] = child_mode
+            if base_is_tree:
+                try:
+                    child_base_mode, child_base_hexsha = base_tree[name]
+                except KeyError:
+                    child_base_hexsha = None
+                    child_base_mode = 0
+                else:
+                    kept_children += 1
             else:
-                subinvdelta = []
-            grandchildmodes = {}
-        child_modes.update(grandchildmodes)
-        invdelta.extend(subinvdelta)
-        if child_mode not in (stat.S_IFDIR, DEFAULT_FILE_MODE,
-                              stat.S_IFLNK, DEFAULT_FILE_MODE | 0o111,
-                              S_IFGITLINK):
-            child_modes[child_path] = child_mode
-    # Remove any children that have disappeared
-    if base_tree is not None and type(base_tree) is Tree:
-        invdelta.extend(remove_disappeared_children(
-            base_bzr_tree, old_path, base_tree, existing_children,
-            lookup_object))
-    store_updater.add_object(tree, (file_id, revision_id), path)
+                child_base_hexsha = None
+                child_base_mode = 0
+            if (child_base_hexsha == child_hexsha and
+                    child_base_mode == child_mode):
+                # Nothing has changed since the base revision, so don't
+                # bother looking at the child.
+                continue
+            children.append(
+                (child_mode & _S_IFMT, child_path, name,
+                 (child_base_hexsha, child_hexsha),
+                 (child_base_mode, child_mode), file_id))
+        if not base_is_tree or kept_children == len(base_tree):
+            # Every entry of the base tree is still there
+            existing_children = None
+        todo.append((None, path, file_id, tree, base_tree, old_path,
+                     existing_children))
+        todo.extend(reversed(children))
     return invdelta, child_modes
 
 
@@ -372,16 +457,30 @@ def verify_commit_reconstruction(target_git_object_retriever, lookup_object,
             "objects differ for %s: %r != %r" % (path, old_obj, new_obj))
 
 
-def ensure_inventories_in_repo(repo, trees):
+def ensure_inventories_in_repo(repo, trees, present=None):
+    """Make sure the inventories for trees are in repo itself.
+
+    :param present: Optional set of revision ids whose inventories are known
+        to be in repo; it is updated with the revisions checked here.
+    """
+    if present is not None:
+        trees = [t for t in trees if t.get_revision_id() not in present]
+        if not trees:
+            return
     real_inv_vf = repo.inventories.without_fallbacks()
     for t in trees:
         revid = t.get_revision_id()
         if not real_inv_vf.get_parent_map([(revid, )]):
             repo.add_inventory(revid, t.root_inventory, t.get_parent_ids())
+        if present is not None:
+            present.add(revid)
 
 
 def import_git_commit(repo, mapping, head, lookup_object,
-                      target_git_object_retriever, trees_cache, strict):
+                      target_git_object_retriever, trees_cache, strict,
+                      lookup_file_id=None, present_inventories=None):
+    if lookup_file_id is None:
+        lookup_file_id = mapping.generate_file_id
     o = lookup_object(head)
     # Note that this uses mapping.revision_id_foreign_to_bzr. If the parents
     # were bzr roundtripped revisions they would be specified in the
@@ -395,7 +494,7 @@ def import_git_commit(repo, mapping, head, lookup_object,
     # we need to make sure to import the blobs / trees with the right
     # path; this may involve adding them more than once.
     parent_trees = trees_cache.revision_trees(rev.parent_ids)
-    ensure_inventories_in_repo(repo, parent_trees)
+    ensure_inventories_in_repo(repo, parent_trees, present_inventories)
     if parent_trees == []:
         base_bzr_tree = trees_cache.revision_tree(NULL_REVISION)
         base_tree = None
@@ -405,14 +504,16 @@ def import_git_commit(repo, mapping, head, lookup_object,
         base_tree = lookup_object(o.parents[0]).tree
         base_mode = stat.S_IFDIR
     store_updater = target_git_object_retriever._get_updater(rev)
+    texts = BatchedTexts(repo.texts)
     inv_delta, unusual_modes = import_git_tree(
-        repo.texts, mapping, b"", b"", (base_tree, o.tree), base_bzr_tree,
+        texts, mapping, b"", b"", (base_tree, o.tree), base_bzr_tree,
         None, rev.revision_id, parent_trees, lookup_object,
         (base_mode, stat.S_IFDIR), store_updater,
-        mapping.generate_file_id,
+        lookup_file_id,
         allow_submodules=repo._format.supports_tree_reference)
-    if unusual_modes != {}:
-        for path, mode in unusual_modes.iteritems():
+    texts.flush()
+    if unusual_modes:
+        for path, mode in unusual_modes.items():
             warn_unusual_mode(rev.foreign_revid, path, mode)
         mapping.import_unusual_file_modes(rev, unusual_modes)
     try:
@@ -444,6 +545,8 @@ def import_git_commit(repo, mapping, head, lookup_object,
     store_updater.add_object(o, calculated_verifiers, None)
     store_updater.finish()
     trees_cache.add(ret_tree)
+    if present_inventories is not None:
+        present_inventories.add(rev.revision_id)
     repo.add_revision(rev.revision_id, rev)
     if "verify" in debug.debug_flags:
         verify_commit_reconstruction(
@@ -466,46 +569,86 @@ def import_git_objects(repo, mapping, object_iter,
             return object_iter[sha]
         except KeyError:
             return target_git_object_retriever[sha]
+    # The same paths come up again for every revision that is imported,
+    # so remember the file ids generated for them.
+    file_id_cache = lru_cache.LRUCache(10000)
+
+    def lookup_file_id(path):
+        file_id = file_id_cache.get(path)
+        if file_id is None:
+            file_id = mapping.generate_file_id(path)
+            file_id_cache[path] = file_id
+        return file_id
     graph = []
+    bzr_revids = {}
     checked = set()
     heads = list(set(heads))
+    # With a single head and no merges the walk below visits a plain chain
+    # of commits, child before parent.
+    single_chain = (len(heads) == 1)
     trees_cache = LRUTreeCache(repo)
-    # Find and convert commit objects
+    # Find and convert commit objects. The heads are processed a generation
+    # at a time, so that the target repository only has to be asked once
+    # per generation which of the commits it already has.
     while heads:
         if pb is not None:
             pb.update("finding revisions to fetch", len(graph), None)
-        head = heads.pop()
-        if head == ZERO_SHA:
-            continue
-        if not isinstance(head, bytes):
-            raise TypeError(head)
-        try:
-            o = lookup_object(head)
-        except KeyError:
-            continue
-        if isinstance(o, Commit):
-            rev, roundtrip_revid, verifiers = mapping.import_commit(
-                o, mapping.revision_id_foreign_to_bzr, strict=True)
-            if (repo.has_revision(rev.revision_id)
-                    or (roundtrip_revid and
-                        repo.has_revision(roundtrip_revid))):
+        current = heads
+        heads = []
+        commits = []
+        for head in current:
+            if head == ZERO_SHA:
+                continue
+            if not isinstance(head, bytes):
+                raise TypeError(head)
+            if head in checked:
                 continue
+            try:
+                o = lookup_object(head)
+            except KeyError:
+                continue
+            if isinstance(o, Commit):
+                rev, roundtrip_revid, verifiers = mapping.import_commit(
+                    o, mapping.revision_id_foreign_to_bzr, strict=True)
+                commits.append((o, rev.revision_id, roundtrip_revid))
+            elif isinstance(o, Tag):
+                if o.object[1] not in checked:
+                    heads.append(o.object[1])
+            else:
+                trace.warning("Unable to import head object %r" % o)
+            checked.add(o.id)
+        present = repo.has_revisions(
+            [revid for (o, revid, roundtrip_revid) in commits] +
+            [roundtrip_revid for (o, revid, roundtrip_revid) in commits
+             if roundtrip_revid])
+        for (o, revid, roundtrip_revid) in commits:
+            if revid in present or roundtrip_revid in present:
+                continue
+            if len(o.parents) > 1:
+                single_chain = False
             graph.append((o.id, o.parents))
+            bzr_revids[o.id] = roundtrip_revid or revid
             heads.extend([p for p in o.parents if p not in checked])
-        elif isinstance(o, Tag):
-            if o.object[1] not in checked:
-                heads.append(o.object[1])
-        else:
-            trace.warning("Unable to import head object %r" % o)
-        checked.add(o.id)
     del checked
     # Order the revisions
     # Create the inventory objects
     batch_size = 1000
-    revision_ids = topo_sort(graph)
+    if single_chain:
+        revision_ids = [sha for (sha, parents) in reversed(graph)]
+    else:
+        revision_ids = topo_sort(graph)
     pack_hints = []
     if limit is not None:
         revision_ids = revision_ids[:limit]
+    # Count how many of the revisions to import still need each parent, so
+    # that parent trees can be dropped from the cache after their last use
+    # rather than pushing out trees that are still needed.
+    parent_map = dict(graph)
+    pending_children = collections.Counter(
+        p for head in revision_ids for p in parent_map[head])
+    # Inventories known to be in repo, so that siblings sharing a parent
+    # don't check for it again.
+    present_inventories = set()
     last_imported = None
     for offset in range(0, len(revision_ids), batch_size):
         target_git_object_retriever.start_write_group()
@@ -519,7 +662,15 @@ def import_git_objects(repo, mapping, object_iter,
                                   len(revision_ids))
                     import_git_commit(repo, mapping, head, lookup_object,
                                       target_git_object_retriever, trees_cache,
-                                      strict=True)
+                                      strict=True,
+                                      lookup_file_id=lookup_file_id,
+                                      present_inventories=present_inventories)
+                    for parent in parent_map[head]:
+                        pending_children[parent] -= 1
+                        if not pending_children[parent]:
+                            trees_cache.discard(
+                                bzr_revids.get(parent)
+                                or mapping.revision_id_foreign_to_bzr(parent))
                     last_imported = head
             except BaseException:
                 repo.abort_write_group()
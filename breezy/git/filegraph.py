@@ -23,6 +23,10 @@ import stat
 from dulwich.errors import (
     NotTreeError,
     )
+from dulwich.objects import (
+    S_ISGITLINK,
+    Tree,
+    )
 try:
     from dulwich.objects import SubmoduleEncountered
 except ImportError:
@@ -32,6 +36,7 @@ from dulwich.object_store import (
     tree_lookup_path,
     )
 
+from .. import lru_cache
 from ..revision import (
     NULL_REVISION,
     )
@@ -46,6 +51,34 @@ class GitFileLastChangeScanner(object):
     def __init__(self, repository):
         self.repository = repository
         self.store = self.repository._git.object_store
+        # Entries of tree objects, by tree SHA and name. Successive commits
+        # mostly share subtrees, so walking the same path in each of them
+        # only has to read the trees that changed.
+        self._tree_entry_cache = lru_cache.LRUCache(50000)
+
+    def _lookup_path(self, store, tree_id, path):
+        """Look up a path in a tree, like dulwich's tree_lookup_path."""
+        if not path:
+            return tree_lookup_path(store.__getitem__, tree_id, path)
+        cache = self._tree_entry_cache
+        parts = path.split(b"/")
+        sha = tree_id
+        mode = None
+        for i, p in enumerate(parts):
+            if not p:
+                continue
+            if mode is not None and S_ISGITLINK(mode):
+                raise SubmoduleEncountered(b"/".join(parts[:i]), sha)
+            try:
+                mode, sha = cache[(sha, p)]
+            except KeyError:
+                obj = store[sha]
+                if not isinstance(obj, Tree):
+                    raise NotTreeError(sha)
+                entry = obj[p]
+                cache[(sha, p)] = entry
+                mode, sha = entry
+        return mode, sha
 
     def find_last_change_revision(self, path, commit_id):
         if not isinstance(path, bytes):
@@ -54,8 +87,8 @@ class GitFileLastChangeScanner(object):
         while True:
             commit = store[commit_id]
             try:
-                target_mode, target_sha = tree_lookup_path(
-                    store.__getitem__, commit.tree, path)
+                target_mode, target_sha = self._lookup_path(
+                    store, commit.tree, path)
             except SubmoduleEncountered as e:
                 revid = self.repository.lookup_foreign_revision_id(commit_id)
                 revtree = self.repository.revision_tree(revid)
@@ -73,8 +106,8 @@ class GitFileLastChangeScanner(object):
             parent_commits = []
             for parent_commit in [store[c] for c in commit.parents]:
                 try:
-                    mode, sha = tree_lookup_path(store.__getitem__,
-                                                 parent_commit.tree, path)
+                    mode, sha = self._lookup_path(
+                        store, parent_commit.tree, path)
                 except (NotTreeError, KeyError):
                     continue
                 else:
@@ -98,31 +131,45 @@ class GitFileParentProvider(object):
         self.change_scanner = change_scanner
         self.store = self.change_scanner.repository._git.object_store
 
-    def _get_parents(self, file_id, text_revision):
-        commit_id, mapping = (
-            self.change_scanner.repository.lookup_bzr_revision_id(
-                text_revision))
+    def _get_parents(self, file_id, text_revision, commit_cache, revid_cache):
+        repository = self.change_scanner.repository
+        try:
+            commit_id, mapping, commit_parents = commit_cache[text_revision]
+        except KeyError:
+            commit_id, mapping = repository.lookup_bzr_revision_id(
+                text_revision)
+            commit_parents = self.store[commit_id].parents
+            commit_cache[text_revision] = (commit_id, mapping, commit_parents)
         try:
             path = encode_git_path(mapping.parse_file_id(file_id))
         except ValueError:
             raise KeyError(file_id)
         text_parents = []
-        for commit_parent in self.store[commit_id].parents:
+        for commit_parent in commit_parents:
             try:
-                (store, path, text_parent) = (
+                (store, unused_path, text_parent) = (
                     self.change_scanner.find_last_change_revision(
                         path, commit_parent))
             except KeyError:
                 continue
             if text_parent not in text_parents:
                 text_parents.append(text_parent)
-        return tuple([
-            (file_id,
-                self.change_scanner.repository.lookup_foreign_revision_id(p))
-            for p in text_parents])
+        ret = []
+        for text_parent in text_parents:
+            try:
+                revid = revid_cache[text_parent]
+            except KeyError:
+                revid = repository.lookup_foreign_revision_id(text_parent)
+                revid_cache[text_parent] = revid
+            ret.append((file_id, revid))
+        return tuple(ret)
 
     def get_parent_map(self, keys):
         ret = {}
+        # Keys often share a text revision or text parents, so only look up
+        # each commit and revision id once.
+        commit_cache = {}
+        revid_cache = {}
         for key in keys:
             (file_id, text_revision) = key
             if text_revision == NULL_REVISION:
@@ -133,7 +180,8 @@ class GitFileParentProvider(object):
             if not isinstance(text_revision, bytes):
                 raise TypeError(text_revision)
             try:
-                ret[key] = self._get_parents(file_id, text_revision)
+                ret[key] = self._get_parents(
+                    file_id, text_revision, commit_cache, revid_cache)
             except KeyError:
                 pass
         return ret
@@ -413,9 +413,12 @@ class InterFromGitRepository(InterRepository):
         wants = set(wants)
 
         def determine_wants(refs):
+            if not wants and not include_tags:
+                # Nothing to look up in refs
+                return []
             unpeel_lookup = {}
             for k, v in refs.items():
-                if k.endswith(ANNOTATED_TAG_SUFFIX):
+                if v in wants and k.endswith(ANNOTATED_TAG_SUFFIX):
                     unpeel_lookup[v] = refs[k[:-len(ANNOTATED_TAG_SUFFIX)]]
             potential = set([unpeel_lookup.get(w, w) for w in wants])
             if include_tags:
@@ -492,7 +495,11 @@ class InterGitNonGitRepository(InterFromGitRepository):
             # For non-git target repositories, only worry about peeled
             if v == ZERO_SHA:
                 continue
-            potential.add(self.source.controldir.get_peeled(k) or v)
+            if k.endswith(ANNOTATED_TAG_SUFFIX):
+                # Already peeled by the source
+                potential.add(v)
+            elif k + ANNOTATED_TAG_SUFFIX not in refs:
+                potential.add(self.source.controldir.get_peeled(k) or v)
         return list(potential - self._target_has_shas(potential))
 
     def _warn_slow(self):
@@ -513,10 +520,9 @@ class InterGitNonGitRepository(InterFromGitRepository):
         raise NotImplementedError(self.fetch_objects)
 
     def get_determine_wants_revids(self, revids, include_tags=False, tag_selector=None):
+        revids = set(revids)
         wants = set()
-        for revid in set(revids):
-            if self.target.has_revision(revid):
-                continue
+        for revid in revids.difference(self.target.has_revisions(revids)):
             git_sha, mapping = self.source.lookup_bzr_revision_id(revid)
             wants.add(git_sha)
         return self.get_determine_wants_heads(
@@ -212,7 +212,10 @@ class BzrGitMapping(foreign.VcsMapping):
         if unusual_file_modes:
             ret = [(path, unusual_file_modes[path])
                    for path in sorted(unusual_file_modes.keys())]
-            rev.properties[u'file-modes'] = bencode.bencode(ret)
+            # Git paths are arbitrary bytes; keep any that are not valid
+            # utf-8 the same way decode_git_path does.
+            rev.properties[u'file-modes'] = bencode.bencode(ret).decode(
+                'utf-8', 'surrogateescape')
 
     def export_unusual_file_modes(self, rev):
         try:
@@ -220,7 +223,8 @@ class BzrGitMapping(foreign.VcsMapping):
         except KeyError:
             return {}
         else:
-            return dict(bencode.bdecode(file_modes.encode("utf-8")))
+            return dict(bencode.bdecode(
+                file_modes.encode("utf-8", "surrogateescape")))
 
     def _generate_git_svn_metadata(self, rev, encoding):
         try:
@@ -353,9 +357,8 @@ class BzrGitMapping(foreign.VcsMapping):
         if not isinstance(commit.message, bytes):
             raise TypeError(commit.message)
         if metadata is not None:
-            try:
-                mapping_registry.parse_revision_id(rev.revision_id)
-            except errors.InvalidRevisionId:
+            if mapping_registry.try_revision_id_bzr_to_foreign(
+                    rev.revision_id) is None:
                 metadata.revision_id = rev.revision_id
             mapping_properties = set(
                 [u'author', u'author-timezone', u'author-timezone-neg-utc',
@@ -563,6 +566,19 @@ class GitMappingRegistry(VcsMappingRegistry):
 
     parse_revision_id = revision_id_bzr_to_foreign
 
+    def try_revision_id_bzr_to_foreign(self, bzr_revid):
+        """Convert a Bazaar revision id, returning None if it is not a git one.
+
+        Most revisions seen when pushing are native Bazaar revisions, so
+        this avoids raising and catching InvalidRevisionId for each of them.
+        """
+        if bzr_revid != NULL_REVISION and not bzr_revid.startswith(b"git-"):
+            return None
+        try:
+            return self.revision_id_bzr_to_foreign(bzr_revid)
+        except errors.InvalidRevisionId:
+            return None
+
 
 mapping_registry = GitMappingRegistry()
 mapping_registry.register_lazy(b'git-v1', __name__,
@@ -671,13 +687,11 @@ def entry_mode(entry):
 
 
 def extract_unusual_modes(rev):
-    try:
-        foreign_revid, mapping = mapping_registry.parse_revision_id(
-            rev.revision_id)
-    except errors.InvalidRevisionId:
+    parsed = mapping_registry.try_revision_id_bzr_to_foreign(rev.revision_id)
+    if parsed is None:
         return {}
-    else:
-        return mapping.export_unusual_file_modes(rev)
+    foreign_revid, mapping = parsed
+    return mapping.export_unusual_file_modes(rev)
 
 
 def parse_git_svn_id(text):
@@ -687,9 +701,4 @@ def parse_git_svn_id(text):
 
 
 def needs_roundtripping(repo, revid):
-    try:
-        mapping_registry.parse_revision_id(revid)
-    except errors.InvalidRevisionId:
-        return True
-    else:
-        return False
+    return mapping_registry.try_revision_id_bzr_to_foreign(revid) is None
@@ -132,6 +132,13 @@ class LRUTreeCache(object):
     def add(self, tree):
         self._cache[tree.get_revision_id()] = tree
 
+    def discard(self, revid):
+        """Drop the tree for revid from the cache, if it is present."""
+        try:
+            del self._cache[revid]
+        except KeyError:
+            pass
+
 
 def _find_missing_bzr_revids(graph, want, have, shallow=None):
     """Find the revisions that have to be pushed.
@@ -532,13 +539,10 @@ class BazaarObjectStore(BaseObjectStore):
             verifiers = {}
         commit_obj = self._reconstruct_commit(rev, root_tree.id,
                                               lossy=lossy, verifiers=verifiers)
-        try:
-            foreign_revid, mapping = mapping_registry.parse_revision_id(
-                rev.revision_id)
-        except errors.InvalidRevisionId:
-            pass
-        else:
-            _check_expected_sha(foreign_revid, commit_obj)
+        parsed = mapping_registry.try_revision_id_bzr_to_foreign(
+            rev.revision_id)
+        if parsed is not None:
+            _check_expected_sha(parsed[0], commit_obj)
         if add_cache_entry is not None:
             add_cache_entry(commit_obj, verifiers, None)
 
@@ -637,11 +641,11 @@ class BazaarObjectStore(BaseObjectStore):
         try:
             return self._cache.idmap.lookup_commit(revid)
         except KeyError:
-            try:
-                return mapping_registry.parse_revision_id(revid)[0]
-            except errors.InvalidRevisionId:
-                self._update_sha_map(revid)
-                return self._cache.idmap.lookup_commit(revid)
+            parsed = mapping_registry.try_revision_id_bzr_to_foreign(revid)
+            if parsed is not None:
+                return parsed[0]
+            self._update_sha_map(revid)
+            return self._cache.idmap.lookup_commit(revid)
 
     def get_raw(self, sha):
         """Get the raw representation of a Git object by SHA1.
@@ -17,12 +17,14 @@
 
 """Test the GitDir class"""
 
+from dulwich.objects import Commit, Tag
 from dulwich.repo import Repo as GitRepo
 import os
 
 from ... import (
     controldir,
     errors,
+    lru_cache,
     urlutils,
     )
 from ...transport import get_transport
@@ -46,6 +48,20 @@ class TestGitDir(tests.TestCaseInTempDir):
             urlutils.local_path_to_url(os.path.abspath(".")),
             gd.get_branch_reference())
 
+    def test_get_branch_reference_changed(self):
+        r = GitRepo.init(".")
+
+        gd = controldir.ControlDir.open('.')
+        self.assertEqual(
+            "%s,branch=master" %
+            urlutils.local_path_to_url(os.path.abspath(".")),
+            gd.get_branch_reference())
+        r.refs.set_symbolic_ref(b'HEAD', b'refs/heads/other')
+        self.assertEqual(
+            "%s,branch=other" %
+            urlutils.local_path_to_url(os.path.abspath(".")),
+            gd.get_branch_reference())
+
     def test_get_reference_loop(self):
         r = GitRepo.init(".")
         r.refs.set_symbolic_ref(b'refs/heads/loop', b'refs/heads/loop')
@@ -76,6 +92,55 @@ class TestGitDir(tests.TestCaseInTempDir):
         gd = controldir.ControlDir.open('.')
         self.assertRaises(errors.NotBranchError, gd.open_branch, 'foo')
 
+    def test_get_branches(self):
+        r = GitRepo.init(".")
+        cid = r.do_commit(message=b"message")
+        r.refs[b'refs/heads/foo'] = cid
+        gd = controldir.ControlDir.open('.')
+        branches = gd.get_branches()
+        self.assertEqual({'', 'master', 'foo'}, set(branches))
+        self.assertEqual(b'refs/heads/master', branches[''].ref)
+        self.assertEqual(b'refs/heads/foo', branches['foo'].ref)
+
+    def test_creation_modes_cached(self):
+        GitRepo.init(".")
+        os.chmod('.git', 0o750)
+        gd = controldir.ControlDir.open('.')
+        self.assertEqual(0o750, gd._get_dir_mode())
+        self.assertEqual(0o640, gd._get_file_mode())
+        os.chmod('.git', 0o755)
+        gd = controldir.ControlDir.open('.')
+        self.assertEqual(0o750, gd._get_dir_mode())
+        self.overrideAttr(dir, '_MODE_CACHE_TIMEOUT', 0)
+        gd = controldir.ControlDir.open('.')
+        self.assertEqual(0o755, gd._get_dir_mode())
+
+    def test_creation_modes_cache_bounded(self):
+        self.overrideAttr(
+            dir, '_mode_cache', lru_cache.LRUCache(1, after_cleanup_count=1))
+        for name in ['a', 'b']:
+            GitRepo.init(name, mkdir=True)
+            controldir.ControlDir.open(name)._get_dir_mode()
+        self.assertEqual(1, len(dir._mode_cache))
+
+    def test_clone_annotated_tag(self):
+        r = GitRepo.init('a', mkdir=True)
+        cid = r.do_commit(message=b'a')
+        tag = Tag()
+        tag.name = b'v1'
+        tag.tagger = b'Somebody <somebody@example.com>'
+        tag.tag_time = 0
+        tag.tag_timezone = 0
+        tag.message = b'Tag v1'
+        tag.object = (Commit, cid)
+        r.object_store.add_object(tag)
+        r.refs[b'refs/tags/v1'] = tag.id
+        source = controldir.ControlDir.open('a')
+        source.clone('b')
+        refs = GitRepo('b').refs
+        self.assertEqual(tag.id, refs[b'refs/tags/v1'])
+        self.assertEqual(cid, refs.get_peeled(b'refs/tags/v1'))
+
     def test_open_workingtree(self):
         r = GitRepo.init(".")
         r.do_commit(message=b"message")
@@ -123,3 +188,11 @@ class TestGitDirFormat(tests.TestCase):
         self.assertEqual(self.format, self.format)
         bzr_format = controldir.format_registry.make_controldir("default")
         self.assertNotEqual(self.format, bzr_format)
+
+    def test_is_control_filename(self):
+        self.assertTrue(self.format.is_control_filename('.git'))
+        self.assertTrue(self.format.is_control_filename('.git/HEAD'))
+        self.assertTrue(self.format.is_control_filename('.git\\HEAD'))
+        self.assertFalse(self.format.is_control_filename('.gitignore'))
+        self.assertFalse(self.format.is_control_filename('.gi'))
+        self.assertFalse(self.format.is_control_filename('foo/.git'))
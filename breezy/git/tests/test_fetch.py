@@ -54,6 +54,7 @@ from ...tests import (
     )
 
 from ..fetch import (
+    BatchedTexts,
     import_git_blob,
     import_git_tree,
     import_git_submodule,
@@ -130,6 +131,69 @@ class RepositoryFetchTests(object):
         self.assertEqual(set([revid1, revid2]),
                          set(newrepo.all_revision_ids()))
 
+    def test_merge(self):
+        self.make_git_repo("d")
+        os.chdir("d")
+        bb = GitBranchBuilder()
+        bb.set_file("foobar", b"foo\nbar\n", False)
+        mark1 = bb.commit(b"Somebody <somebody@someorg.org>", b"mymsg")
+        bb.set_file("foobar", b"fooll\nbar\n", False)
+        mark2 = bb.commit(b"Somebody <somebody@someorg.org>", b"nextmsg")
+        bb.set_file("other", b"other\n", False)
+        mark3 = bb.commit(b"Somebody <somebody@someorg.org>", b"othermsg",
+                          base=mark1)
+        mark4 = bb.commit(b"Somebody <somebody@someorg.org>", b"merge",
+                          base=mark2, merge=[mark3])
+        marks = bb.finish()
+        os.chdir("..")
+        oldrepo = self.open_git_repo("d")
+        mapping = oldrepo.get_mapping()
+        revids = [mapping.revision_id_foreign_to_bzr(marks[mark])
+                  for mark in (mark1, mark2, mark3, mark4)]
+        newrepo = self.clone_git_repo("d", "f")
+        self.assertEqual(set(revids), set(newrepo.all_revision_ids()))
+        self.assertEqual([revids[1], revids[2]],
+                         newrepo.get_revision(revids[3]).parent_ids)
+
+    def test_file_replaced(self):
+        self.make_git_repo("d")
+        os.chdir("d")
+        bb = GitBranchBuilder()
+        bb.set_file("dir/foo", b"foo\n", False)
+        bb.set_file("dir/bar", b"bar\n", False)
+        bb.commit(b"Somebody <somebody@someorg.org>", b"mymsg")
+        bb.delete_entry("dir/bar")
+        bb.set_file("dir/blie", b"blie\n", False)
+        mark = bb.commit(b"Somebody <somebody@someorg.org>", b"nextmsg")
+        marks = bb.finish()
+        os.chdir("..")
+        oldrepo = self.open_git_repo("d")
+        newrepo = self.clone_git_repo("d", "f")
+        revid = oldrepo.get_mapping().revision_id_foreign_to_bzr(marks[mark])
+        tree = newrepo.revision_tree(revid)
+        self.assertEqual(["dir/blie", "dir/foo"],
+                         sorted(tree.all_versioned_paths() -
+                                set(["", "dir"])))
+
+    def test_nested_dir_removed(self):
+        self.make_git_repo("d")
+        os.chdir("d")
+        bb = GitBranchBuilder()
+        bb.set_file("foo", b"foo\n", False)
+        bb.set_file("dir/sub/bar", b"bar\n", False)
+        bb.set_file("dir/sub/subsub/blie", b"blie\n", False)
+        bb.commit(b"Somebody <somebody@someorg.org>", b"mymsg")
+        bb.delete_entry("dir/sub/bar")
+        bb.delete_entry("dir/sub/subsub/blie")
+        mark = bb.commit(b"Somebody <somebody@someorg.org>", b"nextmsg")
+        marks = bb.finish()
+        os.chdir("..")
+        oldrepo = self.open_git_repo("d")
+        newrepo = self.clone_git_repo("d", "f")
+        revid = oldrepo.get_mapping().revision_id_foreign_to_bzr(marks[mark])
+        tree = newrepo.revision_tree(revid)
+        self.assertEqual(set(["", "foo"]), set(tree.all_versioned_paths()))
+
     def test_dir_becomes_symlink(self):
         self.make_git_repo("d")
         os.chdir("d")
@@ -313,6 +377,24 @@ class RepositoryFetchTests(object):
         newrepo = self.clone_git_repo("d", "f")
         self.assertEqual(set([revid]), set(newrepo.all_revision_ids()))
 
+    def test_unusual_mode(self):
+        r = self.make_git_repo("d")
+        blob = Blob.from_string(b"foo\n")
+        tree = Tree()
+        tree.add(b"foobar", stat.S_IFREG | 0o664, blob.id)
+        r.object_store.add_object(blob)
+        r.object_store.add_object(tree)
+        gitsha = r.do_commit(
+            b"msg", committer=b"Somebody <somebody@example.com>",
+            tree=tree.id)
+        oldrepo = self.open_git_repo("d")
+        revid = oldrepo.get_mapping().revision_id_foreign_to_bzr(gitsha)
+        newrepo = self.clone_git_repo("d", "f")
+        self.assertEqual(
+            {b"foobar": stat.S_IFREG | 0o664},
+            oldrepo.get_mapping().export_unusual_file_modes(
+                newrepo.get_revision(revid)))
+
 
 class LocalRepositoryFetchTests(RepositoryFetchTests, TestCaseWithTransport):
 
@@ -381,6 +463,48 @@ class ImportObjects(TestCaseWithTransport):
         self.assertEqual(b"somerevid", ie.revision)
         self.assertEqual(osutils.sha_strings([b"bar"]), ie.text_sha1)
 
+    def test_import_blob_cached_info(self):
+        blob = Blob.from_string(b"cached")
+        objs = {blob.id: blob}
+        import_git_blob(self._texts, self._mapping, b"bla", b"bla",
+                        (None, blob.id),
+                        None, None, b"somerevid", [], objs.__getitem__,
+                        (None, DEFAULT_FILE_MODE), DummyStoreUpdater(),
+                        self._mapping.generate_file_id)
+        # The size and sha1 of the blob are now known, so the blob itself
+        # is only needed to store the new text.
+        ret = import_git_blob(self._texts, self._mapping, b"bar", b"bar",
+                              (None, blob.id),
+                              None, None, b"otherrevid", [],
+                              objs.__getitem__,
+                              (None, DEFAULT_FILE_MODE), DummyStoreUpdater(),
+                              self._mapping.generate_file_id)
+        ie = ret[0][3]
+        self.assertEqual(6, ie.text_size)
+        self.assertEqual(osutils.sha_strings([b"cached"]), ie.text_sha1)
+
+    def test_batched_texts(self):
+        inserted = []
+
+        class RecordingTexts(object):
+
+            def insert_record_stream(self, stream):
+                inserted.append([record.key for record in stream])
+
+        texts = BatchedTexts(RecordingTexts(), max_size=10)
+        texts.insert_record_stream([versionedfile.ChunkedContentFactory(
+            (b'a', b'rev'), (), None, [b'12345'])])
+        self.assertEqual([], inserted)
+        texts.insert_record_stream([versionedfile.ChunkedContentFactory(
+            (b'b', b'rev'), (), None, [b'678901'])])
+        self.assertEqual([[(b'a', b'rev'), (b'b', b'rev')]], inserted)
+        texts.insert_record_stream([versionedfile.ChunkedContentFactory(
+            (b'c', b'rev'), (), None, [b'x'])])
+        texts.flush()
+        texts.flush()
+        self.assertEqual([[(b'a', b'rev'), (b'b', b'rev')], [(b'c', b'rev')]],
+                         inserted)
+
     def test_import_tree_empty_root(self):
         tree = Tree()
         ret, child_modes = import_git_tree(self._texts, self._mapping, b"", b"",
@@ -481,6 +605,46 @@ class ImportObjects(TestCaseWithTransport):
         self.assertEqual("file", ie.kind)
         self.assertEqual(True, ie.executable)
 
+    def test_import_tree_nested(self):
+        blob = Blob.from_string(b"bar")
+        subtree = Tree()
+        subtree.add(b"b", stat.S_IFREG | 0o644, blob.id)
+        tree = Tree()
+        tree.add(b"a", stat.S_IFDIR, subtree.id)
+        tree.add(b"c", stat.S_IFREG | 0o644, blob.id)
+        objects = {blob.id: blob, subtree.id: subtree, tree.id: tree}
+        ret, child_modes = import_git_tree(
+            self._texts, self._mapping, b"", b"", (None, tree.id), None, None,
+            b"somerevid", [], objects.__getitem__, (None, stat.S_IFDIR),
+            DummyStoreUpdater(), self._mapping.generate_file_id)
+        self.assertEqual(child_modes, {})
+        self.assertEqual(
+            ["", "a", "a/b", "c"], [new_path for (_, new_path, _, _) in ret])
+        self.assertEqual(b"git:a", ret[2][3].parent_id)
+
+    def test_import_tree_deep(self):
+        # Deeply nested trees don't hit the recursion limit.
+        blob = Blob.from_string(b"bar")
+        tree = Tree()
+        tree.add(b"f", stat.S_IFREG | 0o644, blob.id)
+        objects = {blob.id: blob, tree.id: tree}
+        for i in range(1500):
+            parent = Tree()
+            parent.add(b"d", stat.S_IFDIR, tree.id)
+            objects[parent.id] = parent
+            tree = parent
+
+        class DummyTexts(object):
+
+            def insert_record_stream(self, stream):
+                list(stream)
+        ret, child_modes = import_git_tree(
+            DummyTexts(), self._mapping, b"", b"", (None, tree.id), None, None,
+            b"somerevid", [], objects.__getitem__, (None, stat.S_IFDIR),
+            DummyStoreUpdater(), self._mapping.generate_file_id)
+        self.assertEqual(1502, len(ret))
+        self.assertEqual("/".join(["d"] * 1500 + ["f"]), ret[-1][1])
+
     def test_directory_converted_to_submodule(self):
         base_inv = Inventory()
         base_inv.add_path("foo", "directory")
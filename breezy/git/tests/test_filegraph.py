@@ -0,0 +1,79 @@
+# Copyright (C) 2022 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the file graph of git repositories."""
+
+from dulwich.errors import NotTreeError
+from dulwich.object_store import tree_lookup_path
+from dulwich.objects import (
+    Blob,
+    Tree,
+    )
+from dulwich.repo import Repo as GitRepo
+
+from ...repository import Repository
+from ...tests import TestCaseInTempDir
+
+
+class GitFileLastChangeScannerTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super(GitFileLastChangeScannerTests, self).setUp()
+        git_repo = GitRepo.init('.')
+        self.store = git_repo.object_store
+        self.commit1 = self.commit(git_repo, b'one', b'd\n')
+        self.commit2 = self.commit(git_repo, b'two', b'dd\n')
+        self.repository = Repository.open('.')
+        self.scanner = self.repository._file_change_scanner
+
+    def commit(self, git_repo, message, d_contents):
+        c = Blob.from_string(b'c\n')
+        d = Blob.from_string(d_contents)
+        b_tree = Tree()
+        b_tree.add(b'c', 0o100644, c.id)
+        a_tree = Tree()
+        a_tree.add(b'b', 0o040000, b_tree.id)
+        root = Tree()
+        root.add(b'a', 0o040000, a_tree.id)
+        root.add(b'd', 0o100644, d.id)
+        for obj in [c, d, b_tree, a_tree, root]:
+            self.store.add_object(obj)
+        return git_repo.do_commit(
+            message, committer=b'Somebody <somebody@someorg.org>',
+            tree=root.id)
+
+    def test_lookup_path(self):
+        tree_id = self.store[self.commit2].tree
+        for path in [b'a', b'a/b', b'a/b/c', b'd', b'']:
+            self.assertEqual(
+                tree_lookup_path(self.store.__getitem__, tree_id, path),
+                self.scanner._lookup_path(self.store, tree_id, path))
+            # Answered from the cache the second time round
+            self.assertEqual(
+                tree_lookup_path(self.store.__getitem__, tree_id, path),
+                self.scanner._lookup_path(self.store, tree_id, path))
+        self.assertRaises(KeyError, self.scanner._lookup_path,
+                          self.store, tree_id, b'a/missing')
+        self.assertRaises(NotTreeError, self.scanner._lookup_path,
+                          self.store, tree_id, b'd/e')
+
+    def test_find_last_change_revision(self):
+        self.assertEqual(
+            self.commit1,
+            self.scanner.find_last_change_revision(b'a/b/c', self.commit2)[2])
+        self.assertEqual(
+            self.commit2,
+            self.scanner.find_last_change_revision(b'd', self.commit2)[2])
@@ -18,6 +18,7 @@
 """Tests for mapping."""
 
 from ...revision import (
+    NULL_REVISION,
     Revision,
     )
 
@@ -36,6 +37,7 @@ from ..mapping import (
     BzrGitMappingv1,
     escape_file_id,
     fix_person_identifier,
+    mapping_registry,
     unescape_file_id,
     UnknownCommitExtra,
     UnknownCommitEncoding,
@@ -58,6 +60,19 @@ class TestRevidConversionV1(tests.TestCase):
             b"git-v1:"
             b"c6a4d8f1fa4ac650748e647c4b1b368f589a7356"))
 
+    def test_try_revision_id_bzr_to_foreign(self):
+        self.assertEqual((b"c6a4d8f1fa4ac650748e647c4b1b368f589a7356",
+                          BzrGitMappingv1()),
+                         mapping_registry.try_revision_id_bzr_to_foreign(
+            b"git-v1:"
+            b"c6a4d8f1fa4ac650748e647c4b1b368f589a7356"))
+        self.assertEqual(
+            (b"0" * 40, None),
+            mapping_registry.try_revision_id_bzr_to_foreign(NULL_REVISION))
+        self.assertIs(
+            None, mapping_registry.try_revision_id_bzr_to_foreign(
+                b"jelmer@samba.org-20100101000000-abcdef"))
+
     def test_is_control_file(self):
         mapping = BzrGitMappingv1()
         if mapping.roundtripping:
@@ -291,6 +306,14 @@ class TestImportCommit(tests.TestCase):
             mapping.revision_id_foreign_to_bzr(c.id),
             mapping.get_revision_id(c))
 
+    def test_unusual_file_modes_non_utf8_path(self):
+        mapping = BzrGitMappingv1()
+        rev = Revision(b'someid')
+        modes = {b'foo\xc1': 0o100664, b'bar': 0o100600}
+        mapping.import_unusual_file_modes(rev, modes)
+        self.assertIsInstance(rev.properties['file-modes'], str)
+        self.assertEqual(modes, mapping.export_unusual_file_modes(rev))
+
 
 class RoundtripRevisionsFromBazaar(tests.TestCase):
 
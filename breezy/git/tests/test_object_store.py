@@ -141,6 +141,19 @@ class LRUTreeCacheTests(TestCaseWithTransport):
         tree = self.cache.revision_tree(revid)
         self.assertEqual(revid, tree.get_revision_id())
 
+    def test_discard(self):
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        revid = bb.build_snapshot(None,
+                                  [('add', ('', None, 'directory', None)),
+                                   ])
+        bb.finish_series()
+        tree = self.cache.revision_tree(revid)
+        self.assertIs(tree, self.cache.revision_tree(revid))
+        self.cache.discard(revid)
+        self.cache.discard(b"unknown")
+        self.assertIsNot(tree, self.cache.revision_tree(revid))
+
 
 class BazaarObjectStoreTests(TestCaseWithTransport):
 
@@ -323,6 +323,33 @@ class RevisionGistImportTests(tests.TestCaseWithTransport):
                          self.import_rev(revid))
 
 
+class DetermineWantsTests(tests.TestCaseWithTransport):
+
+    def test_determine_wants_all_peeled(self):
+        git_repo = GitRepo.init(self.test_dir)
+        commit_id = git_repo.do_commit(
+            b"msg", committer=b"Joe <joe@example.com>")
+        inter = InterRepository.get(Repository.open(self.test_dir),
+                                    self.make_repository("bzr"))
+        # The tag object itself does not have to be looked up when the
+        # peeled value is already known.
+        refs = {b"HEAD": commit_id,
+                b"refs/tags/foo": b"1" * 40,
+                b"refs/tags/foo^{}": commit_id}
+        self.assertEqual([commit_id], inter.determine_wants_all(refs))
+
+    def test_determine_wants_heads(self):
+        git_repo = GitRepo.init(self.test_dir)
+        commit_id = git_repo.do_commit(
+            b"msg", committer=b"Joe <joe@example.com>")
+        inter = InterRepository.get(Repository.open(self.test_dir),
+                                    self.make_repository("bzr"))
+        refs = {b"HEAD": commit_id}
+        self.assertEqual(
+            [commit_id], inter.get_determine_wants_heads([commit_id])(refs))
+        self.assertEqual([], inter.get_determine_wants_heads([])(refs))
+
+
 class ForeignTestsRepositoryFactory(object):
 
     def make_repository(self, transport):
@@ -85,3 +85,31 @@ class TransportRefContainerTests(TestCaseWithTransport):
         self.assertEqual(
             {b'refs/heads/master': b'2001b954f1ec392f84f7cec2f2f96a76ed6ba4ee'},
             self._refs.get_packed_refs())
+
+    def test_add_packed_refs(self):
+        self._refs[b'refs/heads/loose'] = b'1' * 40
+        self._refs.add_packed_refs({
+            b'refs/heads/master': b'2' * 40,
+            b'refs/heads/loose': b'3' * 40})
+        self.assertFalse(self.get_transport().has('refs/heads/loose'))
+        self.assertEqual(
+            {b'refs/heads/master': b'2' * 40,
+             b'refs/heads/loose': b'3' * 40},
+            self._refs.get_packed_refs())
+        self.assertEqual(b'3' * 40, self._refs[b'refs/heads/loose'])
+        self._refs.add_packed_refs({b'refs/heads/loose': None})
+        self.assertEqual(
+            {b'refs/heads/master': b'2' * 40},
+            TransportRefsContainer(self.get_transport()).get_packed_refs())
+
+    def test_add_packed_refs_peeled(self):
+        self._refs.add_packed_refs(
+            {b'refs/tags/v1': b'2' * 40, b'refs/heads/master': b'3' * 40},
+            {b'refs/tags/v1': b'3' * 40})
+        refs = TransportRefsContainer(self.get_transport())
+        self.assertEqual(b'3' * 40, refs.get_peeled(b'refs/tags/v1'))
+        self.assertEqual(b'3' * 40, refs.get_peeled(b'refs/heads/master'))
+
+    def test_add_packed_refs_head(self):
+        self.assertRaises(
+            ValueError, self._refs.add_packed_refs, {b'HEAD': b'2' * 40})
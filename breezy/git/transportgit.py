@@ -124,14 +124,9 @@ class TransportRefsContainer(RefsContainer):
                 keys.add(refname[base_len:])
         return keys
 
-    def allkeys(self):
+    def _loose_keys(self):
+        """Return the names of the loose refs under refs/."""
         keys = set()
-        try:
-            self.worktree_transport.get_bytes("HEAD")
-        except NoSuchFile:
-            pass
-        else:
-            keys.add(b"HEAD")
         try:
             iter_files = list(self.transport.clone(
                 "refs").iter_files_recursive())
@@ -142,6 +137,17 @@ class TransportRefsContainer(RefsContainer):
                     keys.add(refname)
         except (TransportNotPossible, NoSuchFile):
             pass
+        return keys
+
+    def allkeys(self):
+        keys = set()
+        try:
+            self.worktree_transport.get_bytes("HEAD")
+        except NoSuchFile:
+            pass
+        else:
+            keys.add(b"HEAD")
+        keys.update(self._loose_keys())
         keys.update(self.get_packed_refs())
         return keys
 
@@ -246,6 +252,48 @@ class TransportRefsContainer(RefsContainer):
         with self.transport.open_write_stream("packed-refs") as f:
             write_packed_refs(f, self._packed_refs, self._peeled_refs)
 
+    def add_packed_refs(self, new_refs, peeled=None):
+        """Add the given refs as packed refs.
+
+        This writes the packed-refs file once, rather than creating a loose
+        ref file for each ref. Any existing loose refs with the same names
+        are removed afterwards, since they would otherwise take precedence.
+
+        :param new_refs: A mapping of ref names to SHA1s; a SHA1 of None
+            removes the ref
+        :param peeled: Optional mapping of ref names to the SHA1s they peel
+            to, for refs that point at annotated tags
+        """
+        if not new_refs:
+            return
+        if b'HEAD' in new_refs:
+            raise ValueError("cannot pack HEAD")
+        for name in new_refs:
+            self._check_refname(name)
+        if peeled is None:
+            peeled = {}
+        # reread cached refs from disk
+        self._packed_refs = None
+        packed_refs = dict(self.get_packed_refs())
+        peeled_refs = dict(self._peeled_refs)
+        for name, sha in new_refs.items():
+            if sha is not None:
+                packed_refs[name] = sha
+            else:
+                packed_refs.pop(name, None)
+            if sha is not None and name in peeled:
+                peeled_refs[name] = peeled[name]
+            else:
+                peeled_refs.pop(name, None)
+        with self.transport.open_write_stream("packed-refs") as f:
+            write_packed_refs(f, packed_refs, peeled_refs)
+        self._packed_refs = packed_refs
+        self._peeled_refs = peeled_refs
+        # Only drop the loose refs once the packed refs replacing them
+        # have been written.
+        for name in self._loose_keys().intersection(new_refs):
+            self.transport.delete(urlutils.quote_from_bytes(name))
+
     def set_symbolic_ref(self, name, other):
         """Make a ref point at another ref.
 
@@ -109,6 +109,14 @@ class LRUCache(object):
             # Trigger the cleanup
             self.cleanup()
 
+    def __delitem__(self, key):
+        """Remove key from the cache."""
+        node = self._cache[key]
+        if (node is self._most_recently_used
+                and node.next_key is not _null_key):
+            self._most_recently_used = self._cache[node.next_key]
+        self._remove_node(node)
+
     def cache_size(self):
         """Get the number of entries we will cache."""
         return self._max_cache
@@ -69,15 +69,15 @@ class CommitTemplate(object):
             # changed in new version of the file. So for now a direct diff
             # using patiencediff is done.
             old_revision = self.commit.basis_tree.get_file_revision(old_path)
-            needed = [(found_entry.file_id, found_entry.revision, 'new'),
-                      (found_entry.file_id, old_revision, 'old')]
+            needed = ((found_entry.file_id, found_entry.revision, 0),
+                      (found_entry.file_id, old_revision, 1))
             contents = self.commit.builder.repository.iter_files_bytes(needed)
-            lines = {}
-            for name, chunks in contents:
-                lines[name] = osutils.chunks_to_lines(list(chunks))
-            new = lines['new']
+            sides = [None, None]
+            for idx, chunks in contents:
+                sides[idx] = osutils.chunks_to_lines(list(chunks))
+            new, old = sides
             sequence_matcher = patiencediff.PatienceSequenceMatcher(
-                None, lines['old'], new)
+                None, old, new)
             new_lines = []
             for group in sequence_matcher.get_opcodes():
                 tag, i1, i2, j1, j2 = group
@@ -228,6 +228,23 @@ class TestLRUCache(tests.TestCase):
         self.assertEqual(10, cache.get(1))
         self.assertEqual([1, 2], [n.key for n in walk_lru(cache)])
 
+    def test_delitem(self):
+        cache = lru_cache.LRUCache(max_cache=5)
+
+        cache[1] = 10
+        cache[2] = 20
+        cache[3] = 30
+        self.assertRaises(KeyError, cache.__delitem__, 4)
+        del cache[2]
+        self.assertEqual([3, 1], [n.key for n in walk_lru(cache)])
+        del cache[3]
+        self.assertEqual([1], [n.key for n in walk_lru(cache)])
+        del cache[1]
+        self.assertEqual([], [n.key for n in walk_lru(cache)])
+        self.assertEqual(0, len(cache))
+        cache[4] = 40
+        self.assertEqual([4], [n.key for n in walk_lru(cache)])
+
     def test_keys(self):
         cache = lru_cache.LRUCache(max_cache=5, after_cleanup_count=5)
 
@@ -308,6 +325,12 @@ class TestLRUSizeCache(tests.TestCase):
         cache._remove_node(node)
         self.assertEqual(0, cache._value_size)
 
+    def test_delitem_tracks_size(self):
+        cache = lru_cache.LRUSizeCache()
+        cache['my key'] = 'my value text'
+        del cache['my key']
+        self.assertEqual(0, cache._value_size)
+
     def test_no_add_over_size(self):
         """Adding a large value may not be cached at all."""
         cache = lru_cache.LRUSizeCache(max_size=10, after_cleanup_size=5)
@@ -30,12 +30,14 @@ from ..controldir import ControlDir
 from ..export import export
 from ..upstream_import import (
     common_directory,
+    DirWrapper,
     get_archive_type,
     import_archive,
     import_tar,
     import_zip,
     import_dir,
     NotArchiveType,
+    should_ignore,
     top_path,
     ZipFileWrapper,
 )
@@ -198,6 +200,15 @@ class TestImport(TestCaseInTempDir):
         self.assertIs(common_directory(['ab/c/d', 'ac/c/e']), None)
         self.assertEqual('FEEDME', common_directory(['FEEDME']))
 
+    def test_should_ignore(self):
+        self.assertTrue(should_ignore('.bzr/branch-format'))
+        self.assertFalse(should_ignore('foo/.bzr'))
+        cache = {}
+        self.assertTrue(should_ignore('.bzr/branch-format', cache))
+        self.assertTrue(should_ignore('.bzr/checkout', cache))
+        self.assertFalse(should_ignore('foo/bar', cache))
+        self.assertEqual({'.bzr': True, 'foo': False}, cache)
+
     def test_untar(self):
         def builder(fileobj, mode='w'):
             return tarfile.open('project-0.1.tar', mode, fileobj)
@@ -220,6 +231,23 @@ class TestImport(TestCaseInTempDir):
         # because for directories, the input root is always the output root.
         self.archive_test(builder, import_dir)
 
+    def test_dirwrapper_members(self):
+        self.build_tree(['dir/', 'dir/sub/', 'dir/sub/file', 'dir/script'])
+        os.chmod('dir/script', 0o755)
+        wrapper = DirWrapper(BytesIO(b'dir'))
+        members = dict(
+            (member.name, member) for member in wrapper.getmembers())
+        self.assertEqual(
+            ['dir/script', 'dir/sub/', 'dir/sub/file'], sorted(members))
+        self.assertTrue(members['dir/sub/'].isdir())
+        self.assertFalse(members['dir/sub/'].isreg())
+        self.assertTrue(members['dir/sub/file'].isreg())
+        self.assertFalse(members['dir/sub/file'].issym())
+        self.assertEqual(0o755, members['dir/script'].mode & 0o777)
+        self.assertEqual(
+            sorted(members),
+            sorted(m.name for m in DirWrapper('dir').getmembers()))
+
     def archive_test(self, builder, importer, subdir=False):
         archive_file = self.make_archive(builder, subdir)
         tree = ControlDir.create_standalone_workingtree('tree')
@@ -248,6 +276,18 @@ class TestImport(TestCaseInTempDir):
         import_tar(tree, tar_file)
         self.assertTrue(tree.is_versioned('project-0.1/README'))
 
+    def test_untar_duplicate_member(self):
+        result = BytesIO()
+        with tarfile.open('project-0.1.tar', 'w', result) as tar_file:
+            for contents in [b'first', b'second']:
+                info = tarfile.TarInfo('project-0.1/README')
+                info.size = len(contents)
+                tar_file.addfile(info, BytesIO(contents))
+        result.seek(0)
+        tree = ControlDir.create_standalone_workingtree('tree')
+        import_tar(tree, result)
+        self.assertEqual(b'second', tree.get_file_text('README'))
+
     def test_untar_gzip(self):
         tar_file = self.make_tar(mode='w:gz')
         tree = ControlDir.create_standalone_workingtree('tree')
@@ -47,6 +47,10 @@ def open_from_url(location):
     return get_transport(dirname).get(basename)
 
 
+# Chunk size used when copying member contents into the transform.
+EXTRACT_READSIZE = 1024 * 1024
+
+
 class NotArchiveType(BzrError):
 
     _fmt = '%(path)s is not an archive.'
@@ -99,10 +103,20 @@ class ZipInfoWrapper(object):
 class DirWrapper(object):
 
     def __init__(self, fileobj, mode='r'):
+        """Create a DirWrapper.
+
+        :param fileobj: Either the path of the directory, or a file-like
+            object containing the utf-8 encoded path.
+        """
         if mode != 'r':
             raise AssertionError(
                 'only readonly supported')
-        self.root = os.path.realpath(fileobj.read().decode('utf-8'))
+        if isinstance(fileobj, str):
+            path = fileobj
+        else:
+            path = fileobj.read().decode('utf-8')
+        self.root = os.path.realpath(path)
+        self._root_name = basename(self.root)
 
     def __repr__(self):
         return 'DirWrapper(%r)' % self.root
@@ -112,14 +126,29 @@ class DirWrapper(object):
             mydir = pathjoin(self.root, subdir)
         else:
             mydir = self.root
-        for child in os.listdir(mydir):
-            if subdir is not None:
-                child = pathjoin(subdir, child)
-            fi = FileInfo(self.root, child)
-            yield fi
-            if fi.isdir():
-                for v in self.getmembers(child):
-                    yield v
+        # Directories are walked depth first, keeping one open scandir
+        # iterator per level rather than nesting generators.
+        pending = [(subdir, os.scandir(mydir))]
+        try:
+            while pending:
+                parent, entries = pending[-1]
+                entry = next(entries, None)
+                if entry is None:
+                    entries.close()
+                    pending.pop()
+                    continue
+                if parent is not None:
+                    child = pathjoin(parent, entry.name)
+                else:
+                    child = entry.name
+                fi = FileInfo(self.root, child, dirent=entry,
+                              root_name=self._root_name)
+                yield fi
+                if fi.isdir():
+                    pending.append((child, os.scandir(fi.fullpath)))
+        finally:
+            for parent, entries in pending:
+                entries.close()
 
     def extractfile(self, member):
         return open(member.fullpath, 'rb')
@@ -127,32 +156,59 @@ class DirWrapper(object):
 
 class FileInfo(object):
 
-    def __init__(self, root, filepath):
-        self.fullpath = pathjoin(root, filepath)
+    def __init__(self, root, filepath, dirent=None, root_name=None):
+        if dirent is not None:
+            self.fullpath = dirent.path
+        else:
+            self.fullpath = pathjoin(root, filepath)
         self.root = root
+        if root_name is None:
+            root_name = basename(root)
         if filepath != '':
-            self.name = pathjoin(basename(root), filepath)
+            self.name = pathjoin(root_name, filepath)
         else:
             print('root %r' % root)
-            self.name = basename(root)
+            self.name = root_name
         self.type = None
-        stat = os.lstat(self.fullpath)
-        self.mode = stat.st_mode
+        self.linkname = None
+        # The directory entry from os.scandir, if any. Its file type comes
+        # straight from the directory listing on most platforms, so only
+        # the executable bit of regular files needs a stat call.
+        self._dirent = dirent
+        self._mode = None
         if self.isdir():
             self.name += '/'
 
     def __repr__(self):
         return 'FileInfo(%r)' % self.name
 
+    @property
+    def mode(self):
+        if self._mode is None:
+            if self._dirent is not None:
+                self._mode = self._dirent.stat(follow_symlinks=False).st_mode
+            else:
+                self._mode = os.lstat(self.fullpath).st_mode
+        return self._mode
+
     def isreg(self):
+        if self._dirent is not None:
+            return self._dirent.is_file(follow_symlinks=False)
         return stat.S_ISREG(self.mode)
 
     def isdir(self):
+        if self._dirent is not None:
+            return self._dirent.is_dir(follow_symlinks=False)
         return stat.S_ISDIR(self.mode)
 
     def issym(self):
-        if stat.S_ISLNK(self.mode):
-            self.linkname = os.readlink(self.fullpath)
+        if self._dirent is not None:
+            is_link = self._dirent.is_symlink()
+        else:
+            is_link = stat.S_ISLNK(self.mode)
+        if is_link:
+            if self.linkname is None:
+                self.linkname = os.readlink(self.fullpath)
             return True
         else:
             return False
@@ -204,8 +260,21 @@ def names_of_files(tar_file):
             yield member.name
 
 
-def should_ignore(relative_path):
-    return is_control_filename(top_path(relative_path))
+def should_ignore(relative_path, cache=None):
+    """Check whether relative_path lives in a control directory.
+
+    :param cache: Optional dictionary mapping top level directory names to
+        previous results, since checking a name asks every control dir
+        format in turn.
+    """
+    top = top_path(relative_path)
+    if cache is None:
+        return is_control_filename(top)
+    try:
+        return cache[top]
+    except KeyError:
+        ret = cache[top] = is_control_filename(top)
+        return ret
 
 
 def import_tar(tree, tar_input):
@@ -233,18 +302,42 @@ def import_archive(tree, archive_file):
 
 
 def import_archive_to_transform(tree, archive_file, tt):
-    prefix = common_directory(names_of_files(archive_file))
+    names = list(names_of_files(archive_file))
+    prefix = common_directory(names)
+    # Archives rarely contain the same name twice, so only keep track of
+    # the names that do rather than of every member.
+    duplicates = set()
+    unique = set()
+    for name in names:
+        if name in unique:
+            duplicates.add(name)
+        else:
+            unique.add(name)
+    del names, unique
+    # Most paths are looked up more than once (existing entries, archive
+    # members, implied parents), and canonicalising a path can be costly on
+    # case-insensitive trees.
+    trans_ids = {}
+
+    def trans_id_tree_path(path):
+        try:
+            return trans_ids[path]
+        except KeyError:
+            trans_id = trans_ids[path] = tt.trans_id_tree_path(path)
+            return trans_id
+
     removed = set()
     for path, entry in tree.iter_entries_by_dir():
         if entry.parent_id is None:
             continue
-        trans_id = tt.trans_id_tree_path(path)
+        trans_id = trans_id_tree_path(path)
         tt.delete_contents(trans_id)
         removed.add(path)
 
     added = set()
     implied_parents = set()
     seen = set()
+    ignore_cache = {}
     for member in archive_file.getmembers():
         if member.type == 'g':
             # type 'g' is a header
@@ -260,24 +353,25 @@ def import_archive_to_transform(tree, archive_file, tt):
             relative_path = relative_path.rstrip('/')
         if relative_path == '':
             continue
-        if should_ignore(relative_path):
+        if should_ignore(relative_path, ignore_cache):
             continue
         add_implied_parents(implied_parents, relative_path)
-        trans_id = tt.trans_id_tree_path(relative_path)
+        trans_id = trans_id_tree_path(relative_path)
         added.add(relative_path.rstrip('/'))
-        path = tree.abspath(relative_path)
-        if member.name in seen:
-            if tt.final_kind(trans_id) == 'file':
-                tt.set_executability(None, trans_id)
-            tt.cancel_creation(trans_id)
-        seen.add(member.name)
+        if member.name in duplicates:
+            if member.name in seen:
+                if tt.final_kind(trans_id) == 'file':
+                    tt.set_executability(None, trans_id)
+                tt.cancel_creation(trans_id)
+            seen.add(member.name)
         if member.isreg():
-            tt.create_file(file_iterator(archive_file.extractfile(member)),
-                           trans_id)
+            with archive_file.extractfile(member) as f:
+                tt.create_file(file_iterator(f, EXTRACT_READSIZE), trans_id)
             executable = (member.mode & 0o111) != 0
             tt.set_executability(executable, trans_id)
         elif member.isdir():
-            do_directory(tt, trans_id, tree, relative_path, path)
+            do_directory(tt, trans_id, tree, relative_path,
+                         tree.abspath(relative_path))
         elif member.issym():
             tt.create_symlink(member.linkname, trans_id)
         else:
@@ -287,18 +381,18 @@ def import_archive_to_transform(tree, archive_file, tt):
             file_id = generate_ids.gen_file_id(name)
             tt.version_file(trans_id, file_id=file_id)
 
-    for relative_path in implied_parents.difference(added):
-        if relative_path == "":
-            continue
-        trans_id = tt.trans_id_tree_path(relative_path)
+    implied_parents.difference_update(added)
+    implied_parents.discard("")
+    for relative_path in implied_parents:
+        trans_id = trans_id_tree_path(relative_path)
         path = tree.abspath(relative_path)
         do_directory(tt, trans_id, tree, relative_path, path)
         if tt.tree_file_id(trans_id) is None:
             tt.version_file(trans_id, file_id=trans_id)
-        added.add(relative_path)
+    added.update(implied_parents)
 
     for path in removed.difference(added):
-        tt.unversion_file(tt.trans_id_tree_path(path))
+        tt.unversion_file(trans_id_tree_path(path))
 
     for conflict in tt.cook_conflicts(resolve_conflicts(tt)):
         warning(conflict)
@@ -324,9 +418,7 @@ def do_import(source, tree_directory=None):
             archive, external_compressor = get_archive_type(source)
         except NotArchiveType:
             if file_kind(source) == 'directory':
-                s = BytesIO(source.encode('utf-8'))
-                s.seek(0)
-                import_dir(tree, s)
+                import_dir(tree, source)
             else:
                 raise CommandError('Unhandled import source')
         else: